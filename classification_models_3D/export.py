@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+__all__ = ['to_tensorrt']
+
+_DATA_LOADER = '''import numpy as np
+
+
+def load_data():
+    data = np.load({data_path!r}).astype(np.float32)
+    for i in range(0, len(data) - {batch_size} + 1, {batch_size}):
+        yield {{{input_name!r}: data[i:i + {batch_size}]}}
+'''
+
+
+def _engine_key(model, calib_data, precision, max_batch_size, workspace_mb, opset):
+    """Identifies the engine built by `to_tensorrt`: build options, model
+    architecture and weights, and calibration data for INT8."""
+    digest = hashlib.sha1(model.to_json().encode('utf-8'))
+    for w in model.get_weights():
+        digest.update(np.ascontiguousarray(w).tobytes())
+    key = {
+        'precision': precision,
+        'max_batch_size': max_batch_size,
+        'workspace_mb': workspace_mb,
+        'opset': opset,
+        'model': digest.hexdigest(),
+    }
+    if precision == 'int8':
+        calib_digest = hashlib.sha1(np.ascontiguousarray(calib_data).tobytes())
+        key['calib_data'] = calib_digest.hexdigest()
+    return key
+
+
+def to_tensorrt(model, engine_path, calib_data=None, precision='fp16', max_batch_size=1,
+                workspace_mb=4096, opset=13, overwrite=False):
+    """Builds serialized TensorRT engine from Keras model.
+
+    Model is converted to ONNX with `tf2onnx` and then to TensorRT engine with
+    `polygraphy convert`, which applies layer fusion, precision calibration
+    and kernel autotuning. If `engine_path` already exists and was built
+    from the same model (architecture and weights) with the same options
+    (and calibration data for INT8), it is reused, so the (slow) engine build
+    happens only once. These are recorded in `engine_path + '.json'`, on
+    mismatch the engine is rebuilt.
+
+    The engine has one optimization profile for batch sizes from 1 to
+    `max_batch_size`, tuned for `max_batch_size`. Other input dims are taken
+    from the model input shape and must be known.
+
+    Requires `tf2onnx` and TensorRT with `polygraphy` to be installed.
+    Note: INT8 3D convolutions are accelerated only on GPUs with INT8 Tensor
+    Cores (TensorRT >= 7.2), on Pascal GPUs `int8` gives no speedup over `fp16`.
+    For INT8 TensorRT picks vectorized channel layouts (`kCDHW32`, the
+    `NCHW_VECT_C` family) for Conv3D on its own, reformatting only at the
+    engine boundary. No explicit channel packing is needed in the Keras
+    graph, but channel counts divisible by 32 avoid padding in these
+    layouts, e.g. build with `InceptionV3(..., channel_multiple=32)`.
+
+    Args:
+        model: Keras model, e.g. `InceptionV3(..., build_for_inference=True)`.
+        engine_path: path where serialized engine is stored.
+        calib_data: array of input samples (without batch axis) used for INT8
+            calibration. Required if `precision` is `int8`.
+        precision: one of `fp32`, `fp16` or `int8` (INT8 with FP16 fallback).
+        max_batch_size: largest batch size the engine accepts. INT8
+            calibration runs on batches of this size, so `calib_data`
+            should have at least `max_batch_size` samples.
+        workspace_mb: TensorRT workspace size in MB.
+        opset: ONNX opset used for conversion.
+        overwrite: rebuild the engine even if `engine_path` exists.
+
+    Returns:
+        Path to serialized engine.
+    """
+    if precision not in ('fp32', 'fp16', 'int8'):
+        raise ValueError('precision should be one of "fp32", "fp16", "int8", '
+                         'got {}'.format(precision))
+    if precision == 'int8' and calib_data is None:
+        raise ValueError('calib_data is required for int8 precision')
+    if precision == 'int8' and len(calib_data) < max_batch_size:
+        raise ValueError('calib_data should have at least max_batch_size ({}) samples, '
+                         'got {}'.format(max_batch_size, len(calib_data)))
+    input_shape = tuple(model.inputs[0].shape[1:])
+    if None in input_shape:
+        raise ValueError('model input shape should be fully known (except batch), '
+                         'got {}'.format(input_shape))
+    key = _engine_key(model, calib_data, precision, max_batch_size, workspace_mb, opset)
+    key_path = engine_path + '.json'
+    if os.path.exists(engine_path) and os.path.exists(key_path) and not overwrite:
+        with open(key_path) as f:
+            if json.load(f) == key:
+                return engine_path
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    try:
+        import tf2onnx
+    except ImportError:
+        raise ImportError('to_tensorrt requires tf2onnx: pip install tf2onnx')
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        onnx_path = os.path.join(work_dir, 'model.onnx')
+        model_proto, _ = tf2onnx.convert.from_keras(model, opset=opset, output_path=onnx_path)
+        input_name = model_proto.graph.input[0].name
+
+        def shape_arg(batch_size):
+            return '{}:{}'.format(input_name, list((batch_size,) + input_shape)).replace(' ', '')
+
+        cmd = [
+            'polygraphy', 'convert', onnx_path,
+            '--convert-to', 'trt',
+            '--pool-limit', 'workspace:{}M'.format(workspace_mb),
+            '--trt-min-shapes', shape_arg(1),
+            '--trt-opt-shapes', shape_arg(max_batch_size),
+            '--trt-max-shapes', shape_arg(max_batch_size),
+            '-o', engine_path,
+        ]
+        if precision in ('fp16', 'int8'):
+            cmd.append('--fp16')
+        if precision == 'int8':
+            data_path = os.path.join(work_dir, 'calib_data.npy')
+            np.save(data_path, np.asarray(calib_data))
+            loader_path = os.path.join(work_dir, 'data_loader.py')
+            with open(loader_path, 'w') as f:
+                f.write(_DATA_LOADER.format(
+                    data_path=data_path, input_name=input_name, batch_size=max_batch_size))
+            # calibration cache is kept in `work_dir`, so scales computed for
+            # another model are never reused
+            cmd += [
+                '--int8',
+                '--data-loader-script', loader_path,
+                '--calibration-cache', os.path.join(work_dir, 'calib.cache'),
+            ]
+        subprocess.check_call(cmd)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(key_path, 'w') as f:
+        json.dump(key, f)
+
+    return engine_path
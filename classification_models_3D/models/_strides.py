@@ -0,0 +1,8 @@
+def norm_stride(stride):
+    """Returns stride as a tuple of size 3 (one value for each dimension)."""
+    return tuple(stride) if isinstance(stride, (tuple, list)) else (stride, stride, stride)
+
+
+def pool_window(stride):
+    """Returns pooling window used together with `stride`: one voxel larger in each dimension."""
+    return tuple(s + 1 for s in stride)
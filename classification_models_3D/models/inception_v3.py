@@ -15,6 +15,11 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import re
+import functools
+import numpy as np
+import tensorflow as tf
+from ._strides import norm_stride, pool_window
 from .. import get_submodules_from_kwargs
 from keras_applications import imagenet_utils
 
@@ -25,6 +30,11 @@ models = None
 keras_utils = None
 
 
+def _round_filters(filters, multiple):
+    """Round number of filters up to the nearest multiple of `multiple`."""
+    return ((filters + multiple - 1) // multiple) * multiple
+
+
 def conv3d_bn(
         x,
         filters,
@@ -33,7 +43,11 @@ def conv3d_bn(
         num_z,
         padding='same',
         strides=(1, 1, 1),
-        name=None
+        name=None,
+        bn_axis=None,
+        data_format=None,
+        channel_multiple=None,
+        pool_size=None
 ):
     """Utility function to apply conv + BN.
 
@@ -47,6 +61,18 @@ def conv3d_bn(
         name: name of the ops; will become `name + '_conv'`
             for the convolution and `name + '_bn'` for the
             batch norm layer.
+        bn_axis: channel axis for the batch norm layer. If `None`
+            it is derived from `data_format`.
+        data_format: data format of the convolution, one of
+            `channels_last` or `channels_first`. If `None` the value
+            of `backend.image_data_format()` is used.
+        channel_multiple: if set, `filters` is rounded up to a multiple
+            of this value.
+        pool_size: if set, average pooling with this window (stride 1,
+            `same` padding) is applied between the convolution and the
+            batch norm. For a 1x1x1 convolution this is equal to pooling
+            the input first (both ops are linear), but the pooling runs
+            over `filters` channels instead of all input channels.
 
     # Returns
         Output tensor after applying `Conv2D` and `BatchNormalization`.
@@ -57,21 +83,351 @@ def conv3d_bn(
     else:
         bn_name = None
         conv_name = None
-    if backend.image_data_format() == 'channels_first':
-        bn_axis = 1
-    else:
-        bn_axis = 4
+    if channel_multiple:
+        filters = _round_filters(filters, channel_multiple)
+    if data_format is None:
+        data_format = backend.image_data_format()
+    if bn_axis is None:
+        bn_axis = 1 if data_format == 'channels_first' else 4
     x = layers.Conv3D(
         filters, (num_row, num_col, num_z),
         strides=strides,
         padding=padding,
+        data_format=data_format,
         use_bias=False,
         name=conv_name)(x)
+    if pool_size is not None:
+        x = layers.AveragePooling3D(pool_size,
+                                    strides=(1, 1, 1),
+                                    padding='same',
+                                    data_format=data_format)(x)
     x = layers.BatchNormalization(axis=bn_axis, scale=False, name=bn_name)(x)
     x = layers.Activation('relu', name=name)(x)
     return x
 
 
+def space_to_depth_3d(x, block_size, data_format):
+    """Moves `block_size` blocks of spatial voxels into the channel axis.
+
+    `(N, D, H, W, C)` becomes `(N, D / bd, H / bh, W / bw, bd * bh * bw * C)`
+    for `channels_last`. Spatial dims must be divisible by `block_size`.
+    """
+    bd, bh, bw = block_size
+    if data_format == 'channels_first':
+        c, d, h, w = x.shape[1:]
+        x = tf.reshape(x, [-1, c, d // bd, bd, h // bh, bh, w // bw, bw])
+        x = tf.transpose(x, [0, 3, 5, 7, 1, 2, 4, 6])
+        return tf.reshape(x, [-1, bd * bh * bw * c, d // bd, h // bh, w // bw])
+    d, h, w, c = x.shape[1:]
+    x = tf.reshape(x, [-1, d // bd, bd, h // bh, bh, w // bw, bw, c])
+    x = tf.transpose(x, [0, 1, 3, 5, 2, 4, 6, 7])
+    return tf.reshape(x, [-1, d // bd, h // bh, w // bw, bd * bh * bw * c])
+
+
+def _gpu_available():
+    if backend.backend() != 'tensorflow':
+        return False
+    return len(tf.config.list_physical_devices('GPU')) > 0
+
+
+# Specs of the repeated mixed blocks as `(branches, pool_filters)`.
+# Every branch is a list of `(filters, num_row, num_col, num_z)` convolutions
+# applied one after another. A nested list at the end of a branch holds
+# convolutions applied in parallel whose outputs are concatenated.
+# Each block also has an average pool branch projected to `pool_filters`.
+def _spec_a(pool_filters, factorize_5x5=False):
+    if factorize_5x5:
+        # 5x5x5 conv as two stacked 3x3x3 convs: 54 vs 125 MACs per output
+        branch5x5 = [(48, 1, 1, 1), (64, 3, 3, 3), (64, 3, 3, 3)]
+    else:
+        branch5x5 = [(48, 1, 1, 1), (64, 5, 5, 5)]
+    return [
+        [(64, 1, 1, 1)],
+        branch5x5,
+        [(64, 1, 1, 1), (96, 3, 3, 3), (96, 3, 3, 3)],
+    ], pool_filters
+
+
+def _spec_c(filters, factorize_7x7x7=False):
+    if factorize_7x7x7:
+        # 7x7x7 conv as 1x7x1 -> 7x1x1 -> 1x1x7, so z axis is covered too
+        branch7x7 = [(filters, 1, 1, 1), (filters, 1, 7, 1), (filters, 7, 1, 1),
+                     (192, 1, 1, 7)]
+        branch7x7dbl = [(filters, 1, 1, 1), (filters, 7, 1, 1), (filters, 1, 7, 1),
+                        (filters, 1, 1, 7), (filters, 7, 1, 1), (filters, 1, 7, 1),
+                        (192, 1, 1, 7)]
+    else:
+        branch7x7 = [(filters, 1, 1, 1), (filters, 1, 7, 1), (192, 7, 1, 1)]
+        branch7x7dbl = [(filters, 1, 1, 1), (filters, 7, 1, 1), (filters, 1, 7, 1),
+                        (filters, 7, 1, 1), (192, 1, 7, 1)]
+    return [
+        [(192, 1, 1, 1)],
+        branch7x7,
+        branch7x7dbl,
+    ], 192
+
+
+def _spec_e():
+    return [
+        [(320, 1, 1, 1)],
+        [(384, 1, 1, 1), [(384, 1, 3, 1), (384, 3, 1, 1)]],
+        [(448, 1, 1, 1), (384, 3, 3, 3), [(384, 1, 3, 1), (384, 3, 1, 1)]],
+    ], 192
+
+
+def get_mixed_specs(factorize_5x5=False, factorize_7x7x7=False):
+    return {
+        # mixed 0, 1, 2
+        'a': [_spec_a(f, factorize_5x5) for f in (32, 64, 64)],
+        # mixed 4, 5, 6, 7
+        'c': [_spec_c(f, factorize_7x7x7) for f in (128, 160, 160, 192)],
+        # mixed 9, 10
+        'e': [_spec_e(), _spec_e()],
+    }
+
+
+def inception_block(x, spec, name, channel_axis, split_name=None, project_before_pool=False,
+                    **conv_params):
+    """Builds one mixed block from its spec (see `get_mixed_specs`).
+
+    # Arguments
+        x: input tensor.
+        spec: tuple `(branches, pool_filters)`.
+        name: name of the output concatenation.
+        channel_axis: concatenation axis.
+        split_name: name of the first parallel split concatenation.
+        project_before_pool: if `True`, the pool branch is 1x1x1 conv ->
+            average pooling (cheaper, same result), otherwise average
+            pooling -> 1x1x1 conv (previous layer order).
+        conv_params: additional arguments for `conv3d_bn`.
+
+    # Returns
+        Output tensor of the block.
+    """
+    branches, pool_filters = spec
+    outputs = []
+    for branch_spec in branches:
+        branch = x
+        for conv in branch_spec:
+            if isinstance(conv, list):
+                split = [conv3d_bn(branch, *c, **conv_params) for c in conv]
+                branch = layers.concatenate(split, axis=channel_axis, name=split_name)
+                split_name = None
+            else:
+                branch = conv3d_bn(branch, *conv, **conv_params)
+        outputs.append(branch)
+
+    if project_before_pool:
+        branch_pool = conv3d_bn(x, pool_filters, 1, 1, 1, pool_size=(3, 3, 3), **conv_params)
+    else:
+        branch_pool = layers.AveragePooling3D((3, 3, 3),
+                                              strides=(1, 1, 1),
+                                              padding='same',
+                                              data_format=conv_params.get('data_format'))(x)
+        branch_pool = conv3d_bn(branch_pool, pool_filters, 1, 1, 1, **conv_params)
+    outputs.append(branch_pool)
+    return layers.concatenate(outputs, axis=channel_axis, name=name)
+
+
+@tf.keras.utils.register_keras_serializable(package='classification_models_3D')
+class RecomputeGrad(tf.keras.layers.Layer):
+    """Runs `block` under `tf.recompute_grad` (gradient checkpointing).
+
+    Only the block input is kept for the backward pass, inner activations
+    are recomputed. Note that BatchNormalization layers inside the block
+    update their moving statistics again during recomputation.
+    The layer is registered as Keras serializable, so saved checkpointed
+    models can be loaded with `load_model` without `custom_objects`.
+
+    # Arguments
+        block: Keras model to wrap.
+    """
+
+    def __init__(self, block, **kwargs):
+        super().__init__(**kwargs)
+        self.block = block
+
+    def call(self, x, training=None):
+        return tf.recompute_grad(lambda t: self.block(t, training=training))(x)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'block': tf.keras.layers.serialize(self.block)})
+        return config
+
+    @classmethod
+    def from_config(cls, config):
+        config['block'] = tf.keras.layers.deserialize(config['block'])
+        return cls(**config)
+
+
+def _flat_layers(model_layers):
+    """`model_layers` with nested models (and `RecomputeGrad` blocks) expanded."""
+    result = []
+    for layer in model_layers:
+        if isinstance(layer, RecomputeGrad):
+            layer = layer.block
+        if isinstance(layer, models.Model):
+            result += _flat_layers(layer.layers)
+        else:
+            result.append(layer)
+    return result
+
+
+_RECOMPUTE_NAME = re.compile(r'^(mixed(\d+|5_6)_recompute|recompute_grad(_\d+)?)$')
+
+
+def _saved_with_recompute(path):
+    """Whether weights file `path` was saved from a model with mixed blocks
+    nested into `RecomputeGrad` wrappers. `None` if the file can't be read."""
+    try:
+        import h5py
+    except ImportError:
+        return None
+    try:
+        with h5py.File(path, 'r') as f:
+            if 'model_weights' in f:
+                f = f['model_weights']
+            names = list(f.keys())
+            if 'layers' in f:
+                # Keras 3 `.weights.h5` layout: groups are named after the
+                # layer class, e.g. `layers/recompute_grad_1`
+                names += list(f['layers'].keys())
+    except OSError:
+        return None
+    return any(_RECOMPUTE_NAME.match(n) for n in names)
+
+
+def _copy_weights(src, dst):
+    """Copies weights between two lists of layers of the same architecture,
+    which may differ only in how mixed blocks are nested."""
+    src_layers = [l for l in _flat_layers(src) if l.weights]
+    dst_layers = [l for l in _flat_layers(dst) if l.weights]
+    if len(src_layers) != len(dst_layers):
+        raise ValueError('Can not copy weights: {} layers with weights, expected {}'.format(
+            len(src_layers), len(dst_layers)))
+    for s, d in zip(src_layers, dst_layers):
+        if [w.shape for w in s.weights] != [w.shape for w in d.weights]:
+            raise ValueError('Can not copy weights from layer {} to layer {}: '
+                             'shapes do not match'.format(s.name, d.name))
+        d.set_weights(s.get_weights())
+
+
+def MixedBlock(input_shape, spec, name, channel_axis, project_before_pool=False, **conv_params):
+    """Mixed block (see `inception_block`) wrapped into a standalone model,
+    so the same weights can be applied several times.
+
+    # Arguments
+        input_shape: shape of the block input without batch axis.
+        spec: tuple `(branches, pool_filters)`.
+        name: name of the model.
+        channel_axis: concatenation axis.
+        project_before_pool: see `inception_block`.
+        conv_params: additional arguments for `conv3d_bn`.
+
+    # Returns
+        A Keras model instance.
+    """
+    inputs = layers.Input(shape=input_shape)
+    outputs = inception_block(inputs, spec, name + '_concat', channel_axis,
+                              project_before_pool=project_before_pool, **conv_params)
+    return models.Model(inputs, outputs, name=name)
+
+
+def _fold_batch_norms(model):
+    """Rebuild `model` with every Conv3D -> BN -> ReLU triple replaced by
+    a single Conv3D with bias and ReLU activation.
+
+    BN statistics are folded into the convolution weights:
+    `W' = W * gamma / sqrt(var + eps)`, `b' = beta - mean * gamma / sqrt(var + eps)`.
+    Resulting model is intended for inference only.
+    """
+    producers = {id(l.output): l for l in model.layers}
+
+    # find (conv, bn, relu) triples produced by `conv3d_bn`
+    folded_bn = {}
+    # BN output -> tensor which replaces it, for conv -> avg pool -> BN chains.
+    # BN is a per-channel affine op, so it can be moved before the pooling.
+    aliases = {}
+    for layer in model.layers:
+        if not isinstance(layer, layers.BatchNormalization):
+            continue
+        conv = producers.get(id(layer.input))
+        pool = None
+        if isinstance(conv, layers.AveragePooling3D):
+            pool = conv
+            conv = producers.get(id(pool.input))
+        if isinstance(conv, layers.Conv3D) and conv.get_config()['activation'] == 'linear':
+            folded_bn[conv.name] = layer
+            if pool is not None:
+                aliases[id(layer.output)] = id(pool.output)
+    skipped = set(bn.name for bn in folded_bn.values())
+    fused_relu = {}
+    for layer in model.layers:
+        if isinstance(layer, layers.Activation) and layer.get_config()['activation'] == 'relu':
+            bn = producers.get(id(layer.input))
+            if bn is not None and bn.name in skipped and id(bn.output) not in aliases:
+                fused_relu[bn.name] = layer
+                skipped.add(layer.name)
+
+    tensors = {}
+    for layer in model.layers:
+        if isinstance(layer, layers.InputLayer):
+            tensors[id(layer.output)] = layers.Input(
+                shape=backend.int_shape(layer.output)[1:],
+                dtype=layer.dtype,
+                name=layer.name)
+            continue
+        if layer.name in skipped:
+            continue
+
+        if isinstance(layer.input, (list, tuple)):
+            x = [tensors[aliases.get(id(t), id(t))] for t in layer.input]
+        else:
+            x = tensors[aliases.get(id(layer.input), id(layer.input))]
+
+        bn = folded_bn.get(layer.name)
+        relu = fused_relu.get(bn.name) if bn is not None else None
+        if bn is None:
+            new_layer = layer.__class__.from_config(layer.get_config())
+            tensors[id(layer.output)] = new_layer(x)
+            new_layer.set_weights(layer.get_weights())
+            continue
+
+        config = layer.get_config()
+        config['use_bias'] = True
+        if relu is not None:
+            config['activation'] = 'relu'
+        new_layer = layers.Conv3D.from_config(config)
+        out = new_layer(x)
+
+        kernel = backend.get_value(layer.kernel)
+        bias = backend.get_value(layer.bias) if layer.use_bias else 0.
+        mean = backend.get_value(bn.moving_mean)
+        var = backend.get_value(bn.moving_variance)
+        gamma = backend.get_value(bn.gamma) if bn.scale else 1.
+        beta = backend.get_value(bn.beta) if bn.center else 0.
+        factor = gamma / np.sqrt(var + bn.epsilon)
+        new_layer.set_weights([
+            kernel * factor,
+            (bias - mean) * factor + beta,
+        ])
+
+        tensors[id(layer.output)] = out
+        if id(bn.output) not in aliases:
+            tensors[id(bn.output)] = out
+        if relu is not None:
+            tensors[id(relu.output)] = out
+
+    inputs = [tensors[id(t)] for t in model.inputs]
+    outputs = [tensors[id(t)] for t in model.outputs]
+    if len(inputs) == 1:
+        inputs = inputs[0]
+    if len(outputs) == 1:
+        outputs = outputs[0]
+    return models.Model(inputs, outputs, name=model.name)
+
+
 def InceptionV3(
         include_top=False,
         weights='imagenet',
@@ -80,6 +436,18 @@ def InceptionV3(
         pooling=None,
         classes=1000,
         stride_size=2,
+        force_channels_last=True,
+        channel_multiple=8,
+        build_for_inference=False,
+        factorize_5x5=False,
+        factorize_7x7x7=False,
+        project_before_pool=False,
+        dtype_policy=None,
+        space_to_depth_stem=False,
+        jit_compile=False,
+        share_weights=False,
+        checkpoint_blocks=False,
+        cache=False,
         **kwargs
 ):
     """Instantiates the Inception v3 architecture.
@@ -117,13 +485,88 @@ def InceptionV3(
         classes: optional number of classes to classify images
             into, only to be specified if `include_top` is True, and
             if no `weights` argument is specified.
+        force_channels_last: if `True` and a GPU is available, the model
+            is built internally in `channels_last` (NDHWC) layout even if
+            the Keras config says `channels_first`. The input is permuted
+            once at the model boundary, so cuDNN can pick its NDHWC
+            Tensor Core kernels for every Conv3D. Expected input shape
+            and output layout are the same as without this option.
+        channel_multiple: filter count of every convolution is rounded
+            up to a multiple of this value, so Tensor Cores can be used
+            (8 for FP16, 16 for INT8, 32 for vectorized INT8 TensorRT
+            layouts). All default filter counts are
+            already multiples of 16, so the default does not change the
+            architecture. Set to `None` to disable rounding.
+        build_for_inference: if `True`, after the weights are loaded every
+            Conv3D + BatchNormalization + ReLU triple is folded into a
+            single Conv3D with bias and ReLU activation. This removes two
+            kernel launches and two intermediate activations per block.
+            The returned model is meant for inference only.
+        factorize_5x5: if `True`, the 5x5x5 convolution of mixed 0, 1, 2 is
+            replaced with two stacked 3x3x3 convolutions (~57% less MACs).
+            This changes the architecture, so weights saved with the
+            default `False` can't be loaded into a model built with `True`.
+        factorize_7x7x7: if `True`, the asymmetric 1x7x1 / 7x1x1 convolutions
+            of mixed 4-8 are followed by a 1x1x7 convolution, so the
+            factorized 7x7x7 kernel also covers the third spatial axis.
+            This is a receptive field option, not a speedup: it adds a
+            convolution (with BN and ReLU) to every asymmetric pair, so the
+            model gets slower and bigger. `False` keeps the original layout.
+        project_before_pool: if `True`, the average pool branches apply the
+            1x1x1 projection before the pooling, which gives the same result
+            but pools fewer channels. The layer order changes, so weights
+            saved with the default `False` (original layer order) can't be
+            loaded into a model built with `True` and vice versa.
+        dtype_policy: optional Keras dtype policy name. With `'mixed_float16'`
+            the global policy is set before the layers are created, so every
+            Conv3D/BN computes in FP16 with FP32 variables, while the final
+            `Dense` layer is kept in FP32 for numerical stability. Tensor
+            Cores need both FP16 and `channels_last` layout, so on a
+            `channels_first` setup keep `force_channels_last` enabled.
+            The global policy is restored after the model is built.
+        space_to_depth_stem: if `True`, the first strided convolution is
+            replaced with `space_to_depth_3d` (stride_size[0] blocks moved
+            into channels) followed by an unstrided convolution, so no input
+            reads are skipped. Used only if all spatial dims of the input
+            are known and divisible by `stride_size[0]`, otherwise the
+            strided convolution is kept.
+        jit_compile: if `True`, `model.call` is wrapped with
+            `tf.function(jit_compile=True)`, so XLA compiles the whole graph
+            and fuses elementwise ops (BN, ReLU) into fewer kernels. Similar
+            effect for any model can be reached with the environment variable
+            `TF_XLA_FLAGS=--tf_xla_auto_jit=2`.
+        share_weights: if `True`, mixed 5 and mixed 6 (same spec) are one
+            `MixedBlock` model applied twice, which halves parameters and
+            weight traffic of these blocks. Layers `mixed5` and `mixed6` are
+            replaced with a single nested model `mixed5_6`. Can't be used
+            together with `build_for_inference`.
+        checkpoint_blocks: if `True`, every mixed block is wrapped into a
+            `RecomputeGrad` layer: its inner activations are not stored for
+            the backward pass but recomputed, which allows larger batches or
+            volumes at the cost of ~30% longer training steps. This only
+            helps training, inference is unaffected. During training BN
+            moving statistics are updated twice per step, as the forward pass
+            of each block runs again for the gradient. Layers `mixed0` ...
+            `mixed10` are nested into `mixedN_recompute` wrappers, so
+            `model.get_layer('mixedN')` doesn't find them. Weight files saved
+            from plain or checkpointed models can be loaded with `weights`
+            either way, so a model trained with `checkpoint_blocks=True` can
+            be loaded with `build_for_inference=True` for deployment. Can't
+            be used together with `build_for_inference` itself.
+        cache: if `True`, built models are cached per set of arguments
+            (together with Keras backend, data format and dtype policy), and
+            repeated calls return the already built model instance, so its
+            weights are shared between callers. If `weights` is a file, its
+            modification time and size are part of the key, so an overwritten
+            file is loaded again. Not used if `input_tensor` is given.
+            Use `clear_model_cache()` to drop cached models.
 
     # Returns
         A Keras model instance.
 
     # Raises
         ValueError: in case of invalid argument for `weights`,
-            or invalid input shape.
+            invalid `stride_size` or invalid input shape.
     """
     global backend, layers, models, keras_utils
     backend, layers, models, keras_utils = get_submodules_from_kwargs(kwargs)
@@ -134,30 +577,64 @@ def InceptionV3(
                          '(pre-training on ImageNet), '
                          'or the path to the weights file to be loaded.')
 
+    if share_weights and build_for_inference:
+        raise ValueError('`share_weights` can not be used together with `build_for_inference`')
+
+    if checkpoint_blocks and build_for_inference:
+        raise ValueError('`checkpoint_blocks` can not be used together with `build_for_inference`')
+
     if weights == 'imagenet' and include_top and classes != 1000:
         raise ValueError('If using `weights` as `"imagenet"` with `include_top`'
                          ' as true, `classes` should be 1000')
 
     # if stride_size is scalar make it tuple of length 5 with elements tuple of size 3
     # (stride for each dimension for more flexibility)
-    if type(stride_size) not in (tuple, list):
-        stride_size = [
-            (stride_size, stride_size, stride_size,),
-            (stride_size, stride_size, stride_size,),
-            (stride_size, stride_size, stride_size,),
-            (stride_size, stride_size, stride_size,),
-            (stride_size, stride_size, stride_size,),
-        ]
-    else:
-        stride_size = list(stride_size)
-
+    if not isinstance(stride_size, (tuple, list)):
+        stride_size = [stride_size] * 5
     if len(stride_size) != 5:
-        print('Error: stride_size length must be exactly 5')
-        return None
-
-    for i in range(len(stride_size)):
-        if type(stride_size[i]) not in (tuple, list):
-            stride_size[i] = (stride_size[i], stride_size[i], stride_size[i])
+        raise ValueError('stride_size length must be exactly 5, got {}'.format(len(stride_size)))
+    stride_size = tuple(norm_stride(s) for s in stride_size)
+
+    # arguments which define the built model (used for cache and rebuilds)
+    model_kwargs = dict(
+        include_top=include_top,
+        weights=weights,
+        input_shape=tuple(input_shape) if input_shape is not None else None,
+        pooling=pooling,
+        classes=classes,
+        stride_size=stride_size,
+        force_channels_last=force_channels_last,
+        channel_multiple=channel_multiple,
+        build_for_inference=build_for_inference,
+        factorize_5x5=factorize_5x5,
+        factorize_7x7x7=factorize_7x7x7,
+        project_before_pool=project_before_pool,
+        space_to_depth_stem=space_to_depth_stem,
+        jit_compile=jit_compile,
+        share_weights=share_weights,
+        checkpoint_blocks=checkpoint_blocks,
+    )
+    submodules = dict(backend=backend, layers=layers, models=models, utils=keras_utils)
+
+    if dtype_policy is not None:
+        # layers keep the policy they were created with, so the global policy
+        # is needed only while the graph is built
+        previous_policy = tf.keras.mixed_precision.global_policy()
+        tf.keras.mixed_precision.set_global_policy(dtype_policy)
+        try:
+            return InceptionV3(input_tensor=input_tensor, cache=cache,
+                               **dict(model_kwargs, **submodules))
+        finally:
+            tf.keras.mixed_precision.set_global_policy(previous_policy)
+
+    if cache and input_tensor is None:
+        return _build_cached(
+            (backend, layers, models, keras_utils),
+            backend.image_data_format(),
+            tf.keras.mixed_precision.global_policy().name,
+            _file_stamp(weights) if weights not in {'imagenet', None} else None,
+            **model_kwargs
+        )
 
     if input_tensor is None:
         img_input = layers.Input(shape=input_shape)
@@ -167,212 +644,157 @@ def InceptionV3(
         else:
             img_input = input_tensor
 
-    if backend.image_data_format() == 'channels_first':
+    data_format = backend.image_data_format()
+    permute_input = False
+    if force_channels_last and data_format == 'channels_first' and _gpu_available():
+        data_format = 'channels_last'
+        permute_input = True
+
+    if data_format == 'channels_first':
         channel_axis = 1
     else:
         channel_axis = 4
+    conv_params = {
+        'bn_axis': channel_axis,
+        'data_format': data_format,
+        'channel_multiple': channel_multiple,
+    }
 
-    x = conv3d_bn(img_input, 32, 3, 3, 3, strides=stride_size[0], padding='same')
-    x = conv3d_bn(x, 32, 3, 3, 3, padding='same')
-    x = conv3d_bn(x, 64, 3, 3, 3)
-    pool = (stride_size[1][0] + 1, stride_size[1][1] + 1, stride_size[1][2] + 1)
-    x = layers.MaxPooling3D(pool, strides=stride_size[1], padding='same')(x)
-
-    x = conv3d_bn(x, 80, 1, 1, 1, padding='same')
-    x = conv3d_bn(x, 192, 3, 3, 3, padding='same')
-    pool = (stride_size[2][0] + 1, stride_size[2][1] + 1, stride_size[2][2] + 1)
-    x = layers.MaxPooling3D(pool, strides=stride_size[2], padding='same')(x)
-
-    # mixed 0: 35 x 35 x 256
-    branch1x1 = conv3d_bn(x, 64, 1, 1, 1)
-
-    branch5x5 = conv3d_bn(x, 48, 1, 1, 1)
-    branch5x5 = conv3d_bn(branch5x5, 64, 5, 5, 5)
-
-    branch3x3dbl = conv3d_bn(x, 64, 1, 1, 1)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-
-    branch_pool = layers.AveragePooling3D((3, 3, 3),
-                                          strides=(1, 1, 1),
-                                          padding='same')(x)
-    branch_pool = conv3d_bn(branch_pool, 32, 1, 1, 1)
-    x = layers.concatenate(
-        [branch1x1, branch5x5, branch3x3dbl, branch_pool],
-        axis=channel_axis,
-        name='mixed0')
-
-    # mixed 1: 35 x 35 x 288
-    branch1x1 = conv3d_bn(x, 64, 1, 1, 1)
-
-    branch5x5 = conv3d_bn(x, 48, 1, 1, 1)
-    branch5x5 = conv3d_bn(branch5x5, 64, 5, 5, 5)
-
-    branch3x3dbl = conv3d_bn(x, 64, 1, 1, 1)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-
-    branch_pool = layers.AveragePooling3D((3, 3, 3),
-                                          strides=(1, 1, 1),
-                                          padding='same')(x)
-    branch_pool = conv3d_bn(branch_pool, 64, 1, 1, 1)
-    x = layers.concatenate(
-        [branch1x1, branch5x5, branch3x3dbl, branch_pool],
-        axis=channel_axis,
-        name='mixed1')
-
-    # mixed 2: 35 x 35 x 288
-    branch1x1 = conv3d_bn(x, 64, 1, 1, 1)
-
-    branch5x5 = conv3d_bn(x, 48, 1, 1, 1)
-    branch5x5 = conv3d_bn(branch5x5, 64, 5, 5, 5)
-
-    branch3x3dbl = conv3d_bn(x, 64, 1, 1, 1)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-
-    branch_pool = layers.AveragePooling3D((3, 3, 3),
-                                          strides=(1, 1, 1),
-                                          padding='same')(x)
-    branch_pool = conv3d_bn(branch_pool, 64, 1, 1, 1)
-    x = layers.concatenate(
-        [branch1x1, branch5x5, branch3x3dbl, branch_pool],
-        axis=channel_axis,
-        name='mixed2')
+    mixed_specs = get_mixed_specs(factorize_5x5, factorize_7x7x7)
 
-    # mixed 3: 17 x 17 x 768
-    branch3x3 = conv3d_bn(x, 384, 3, 3, 3, strides=stride_size[3], padding='same')
-
-    branch3x3dbl = conv3d_bn(x, 64, 1, 1, 1)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3)
-    branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3, strides=stride_size[3], padding='same')
-
-    pool = (stride_size[3][0] + 1, stride_size[3][1] + 1, stride_size[3][2] + 1)
-    branch_pool = layers.MaxPooling3D(pool, strides=stride_size[3], padding='same')(x)
-    x = layers.concatenate(
-        [branch3x3, branch3x3dbl, branch_pool],
-        axis=channel_axis,
-        name='mixed3')
-
-    # mixed 4: 17 x 17 x 768
-    branch1x1 = conv3d_bn(x, 192, 1, 1, 1)
-
-    branch7x7 = conv3d_bn(x, 128, 1, 1, 1)
-    branch7x7 = conv3d_bn(branch7x7, 128, 1, 7, 1)
-    branch7x7 = conv3d_bn(branch7x7, 192, 7, 1, 1)
-
-    branch7x7dbl = conv3d_bn(x, 128, 1, 1, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 128, 7, 1, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 128, 1, 7, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 128, 7, 1, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 192, 1, 7, 1)
-
-    branch_pool = layers.AveragePooling3D((3, 3, 3),
-                                          strides=(1, 1, 1),
-                                          padding='same')(x)
-    branch_pool = conv3d_bn(branch_pool, 192, 1, 1, 1)
-    x = layers.concatenate(
-        [branch1x1, branch7x7, branch7x7dbl, branch_pool],
-        axis=channel_axis,
-        name='mixed4')
-
-    # mixed 5, 6: 17 x 17 x 768
-    for i in range(2):
-        branch1x1 = conv3d_bn(x, 192, 1, 1, 1)
-
-        branch7x7 = conv3d_bn(x, 160, 1, 1, 1)
-        branch7x7 = conv3d_bn(branch7x7, 160, 1, 7, 1)
-        branch7x7 = conv3d_bn(branch7x7, 192, 7, 1, 1)
-
-        branch7x7dbl = conv3d_bn(x, 160, 1, 1, 1)
-        branch7x7dbl = conv3d_bn(branch7x7dbl, 160, 7, 1, 1)
-        branch7x7dbl = conv3d_bn(branch7x7dbl, 160, 1, 7, 1)
-        branch7x7dbl = conv3d_bn(branch7x7dbl, 160, 7, 1, 1)
-        branch7x7dbl = conv3d_bn(branch7x7dbl, 192, 1, 7, 1)
-
-        branch_pool = layers.AveragePooling3D(
-            (3, 3, 3), strides=(1, 1, 1), padding='same')(x)
-        branch_pool = conv3d_bn(branch_pool, 192, 1, 1, 1)
-        x = layers.concatenate(
-            [branch1x1, branch7x7, branch7x7dbl, branch_pool],
-            axis=channel_axis,
-            name='mixed' + str(5 + i))
-
-    # mixed 7: 17 x 17 x 768
-    branch1x1 = conv3d_bn(x, 192, 1, 1, 1)
-
-    branch7x7 = conv3d_bn(x, 192, 1, 1, 1)
-    branch7x7 = conv3d_bn(branch7x7, 192, 1, 7, 1)
-    branch7x7 = conv3d_bn(branch7x7, 192, 7, 1, 1)
-
-    branch7x7dbl = conv3d_bn(x, 192, 1, 1, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 192, 7, 1, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 192, 1, 7, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 192, 7, 1, 1)
-    branch7x7dbl = conv3d_bn(branch7x7dbl, 192, 1, 7, 1)
-
-    branch_pool = layers.AveragePooling3D((3, 3, 3),
-                                          strides=(1, 1, 1),
-                                          padding='same')(x)
-    branch_pool = conv3d_bn(branch_pool, 192, 1, 1, 1)
-    x = layers.concatenate(
-        [branch1x1, branch7x7, branch7x7dbl, branch_pool],
-        axis=channel_axis,
-        name='mixed7')
+    x = img_input
+    if permute_input:
+        x = layers.Permute((2, 3, 4, 1))(x)
 
-    # mixed 8: 8 x 8 x 1280
-    branch3x3 = conv3d_bn(x, 192, 1, 1, 1)
-    branch3x3 = conv3d_bn(branch3x3, 320, 3, 3, 3,
-                          strides=stride_size[4], padding='same')
-
-    branch7x7x3 = conv3d_bn(x, 192, 1, 1, 1)
-    branch7x7x3 = conv3d_bn(branch7x7x3, 192, 1, 7, 1)
-    branch7x7x3 = conv3d_bn(branch7x7x3, 192, 7, 1, 1)
-    branch7x7x3 = conv3d_bn(
-        branch7x7x3, 192, 3, 3, 3, strides=stride_size[4], padding='same')
-
-    pool = (stride_size[4][0] + 1, stride_size[4][1] + 1, stride_size[4][2] + 1)
-    branch_pool = layers.MaxPooling3D(pool, strides=stride_size[4], padding='same')(x)
-    x = layers.concatenate(
-        [branch3x3, branch7x7x3, branch_pool],
-        axis=channel_axis,
-        name='mixed8')
-
-    # mixed 9: 8 x 8 x 2048
-    for i in range(2):
-        branch1x1 = conv3d_bn(x, 320, 1, 1, 1)
-
-        branch3x3 = conv3d_bn(x, 384, 1, 1, 1)
-        branch3x3_1 = conv3d_bn(branch3x3, 384, 1, 3, 1)
-        branch3x3_2 = conv3d_bn(branch3x3, 384, 3, 1, 1)
-        branch3x3 = layers.concatenate(
-            [branch3x3_1, branch3x3_2],
+    if data_format == 'channels_first':
+        spatial_dims = backend.int_shape(x)[2:]
+    else:
+        spatial_dims = backend.int_shape(x)[1:4]
+    use_space_to_depth = (
+        space_to_depth_stem and
+        max(stride_size[0]) > 1 and
+        all(d is not None and d % s == 0 for d, s in zip(spatial_dims, stride_size[0]))
+    )
+    if use_space_to_depth:
+        x = layers.Lambda(
+            space_to_depth_3d,
+            arguments={'block_size': tuple(stride_size[0]), 'data_format': data_format},
+            name='space_to_depth')(x)
+        x = conv3d_bn(x, 32, 3, 3, 3, padding='same', **conv_params)
+    else:
+        x = conv3d_bn(x, 32, 3, 3, 3, strides=stride_size[0], padding='same', **conv_params)
+    x = conv3d_bn(x, 32, 3, 3, 3, padding='same', **conv_params)
+    x = conv3d_bn(x, 64, 3, 3, 3, **conv_params)
+    x = layers.MaxPooling3D(pool_window(stride_size[1]),
+                            strides=stride_size[1],
+                            padding='same',
+                            data_format=data_format)(x)
+
+    x = conv3d_bn(x, 80, 1, 1, 1, padding='same', **conv_params)
+    x = conv3d_bn(x, 192, 3, 3, 3, padding='same', **conv_params)
+    x = layers.MaxPooling3D(pool_window(stride_size[2]),
+                            strides=stride_size[2],
+                            padding='same',
+                            data_format=data_format)(x)
+
+    def apply_block(block_fn, x, name):
+        if not checkpoint_blocks:
+            return block_fn(x)
+        inputs = layers.Input(shape=backend.int_shape(x)[1:])
+        block = models.Model(inputs, block_fn(inputs), name=name + '_block')
+        return RecomputeGrad(block, name=name + '_recompute')(x)
+
+    def mixed3(x):
+        branch3x3 = conv3d_bn(x, 384, 3, 3, 3,
+                              strides=stride_size[3], padding='same', **conv_params)
+
+        branch3x3dbl = conv3d_bn(x, 64, 1, 1, 1, **conv_params)
+        branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3, **conv_params)
+        branch3x3dbl = conv3d_bn(branch3x3dbl, 96, 3, 3, 3,
+                                 strides=stride_size[3], padding='same', **conv_params)
+
+        branch_pool = layers.MaxPooling3D(pool_window(stride_size[3]),
+                                          strides=stride_size[3],
+                                          padding='same',
+                                          data_format=data_format)(x)
+        return layers.concatenate(
+            [branch3x3, branch3x3dbl, branch_pool],
             axis=channel_axis,
-            name='mixed9_' + str(i))
-
-        branch3x3dbl = conv3d_bn(x, 448, 1, 1, 1)
-        branch3x3dbl = conv3d_bn(branch3x3dbl, 384, 3, 3, 3)
-        branch3x3dbl_1 = conv3d_bn(branch3x3dbl, 384, 1, 3, 1)
-        branch3x3dbl_2 = conv3d_bn(branch3x3dbl, 384, 3, 1, 1)
-        branch3x3dbl = layers.concatenate(
-            [branch3x3dbl_1, branch3x3dbl_2], axis=channel_axis)
-
-        branch_pool = layers.AveragePooling3D(
-            (3, 3, 3), strides=(1, 1, 1), padding='same')(x)
-        branch_pool = conv3d_bn(branch_pool, 192, 1, 1, 1)
-        x = layers.concatenate(
-            [branch1x1, branch3x3, branch3x3dbl, branch_pool],
+            name='mixed3')
+
+    def mixed8(x):
+        branch3x3 = conv3d_bn(x, 192, 1, 1, 1, **conv_params)
+        branch3x3 = conv3d_bn(branch3x3, 320, 3, 3, 3,
+                              strides=stride_size[4], padding='same', **conv_params)
+
+        branch7x7x3 = conv3d_bn(x, 192, 1, 1, 1, **conv_params)
+        branch7x7x3 = conv3d_bn(branch7x7x3, 192, 1, 7, 1, **conv_params)
+        branch7x7x3 = conv3d_bn(branch7x7x3, 192, 7, 1, 1, **conv_params)
+        if factorize_7x7x7:
+            branch7x7x3 = conv3d_bn(branch7x7x3, 192, 1, 1, 7, **conv_params)
+        branch7x7x3 = conv3d_bn(
+            branch7x7x3, 192, 3, 3, 3, strides=stride_size[4], padding='same', **conv_params)
+
+        branch_pool = layers.MaxPooling3D(pool_window(stride_size[4]),
+                                          strides=stride_size[4],
+                                          padding='same',
+                                          data_format=data_format)(x)
+        return layers.concatenate(
+            [branch3x3, branch7x7x3, branch_pool],
             axis=channel_axis,
-            name='mixed' + str(9 + i))
+            name='mixed8')
+
+    # mixed 0, 1, 2: 35 x 35 x 288
+    for i, spec in enumerate(mixed_specs['a']):
+        name = 'mixed' + str(i)
+        x = apply_block(
+            lambda t: inception_block(t, spec, name, channel_axis,
+                                      project_before_pool=project_before_pool, **conv_params),
+            x, name)
+
+    # mixed 3: 17 x 17 x 768
+    x = apply_block(mixed3, x, 'mixed3')
+
+    # mixed 4, 5, 6, 7: 17 x 17 x 768
+    shared_block = None
+    for i, spec in enumerate(mixed_specs['c']):
+        name = 'mixed' + str(4 + i)
+        if share_weights and i in (1, 2):
+            if shared_block is None:
+                shared_block = MixedBlock(backend.int_shape(x)[1:], spec, 'mixed5_6', channel_axis,
+                                          project_before_pool=project_before_pool, **conv_params)
+                if checkpoint_blocks:
+                    shared_block = RecomputeGrad(shared_block, name='mixed5_6_recompute')
+            x = shared_block(x)
+        else:
+            x = apply_block(
+                lambda t: inception_block(t, spec, name, channel_axis,
+                                          project_before_pool=project_before_pool, **conv_params),
+                x, name)
+
+    # mixed 8: 8 x 8 x 1280
+    x = apply_block(mixed8, x, 'mixed8')
+
+    # mixed 9, 10: 8 x 8 x 2048
+    for i, spec in enumerate(mixed_specs['e']):
+        name = 'mixed' + str(9 + i)
+        x = apply_block(
+            lambda t: inception_block(t, spec, name, channel_axis, split_name='mixed9_' + str(i),
+                                      project_before_pool=project_before_pool, **conv_params),
+            x, name)
+
     if include_top:
         # Classification block
-        x = layers.GlobalAveragePooling3D(name='avg_pool')(x)
-        x = layers.Dense(classes, activation='softmax', name='predictions')(x)
+        x = layers.GlobalAveragePooling3D(name='avg_pool', data_format=data_format)(x)
+        x = layers.Dense(classes, activation='softmax', dtype='float32', name='predictions')(x)
     else:
         if pooling == 'avg':
-            x = layers.GlobalAveragePooling3D()(x)
+            x = layers.GlobalAveragePooling3D(data_format=data_format)(x)
         elif pooling == 'max':
-            x = layers.GlobalMaxPooling3D()(x)
+            x = layers.GlobalMaxPooling3D(data_format=data_format)(x)
+        elif permute_input:
+            # restore the layout the caller asked for
+            x = layers.Permute((4, 1, 2, 3))(x)
 
     # Ensure that the model takes into account
     # any potential predecessors of `input_tensor`.
@@ -387,11 +809,54 @@ def InceptionV3(
     if weights == 'imagenet':
         print('Warning: no imagenet weights available!!!')
     elif weights is not None:
-        model.load_weights(weights)
+        try:
+            model.load_weights(weights)
+        except ValueError:
+            if _saved_with_recompute(weights) in (None, checkpoint_blocks):
+                raise
+            # file is saved with the other layout (mixed blocks nested into
+            # `RecomputeGrad` wrappers or not), so load it into a model with
+            # that layout and copy over. BN folding is done on `model` below.
+            other_kwargs = dict(model_kwargs, weights=None, checkpoint_blocks=not checkpoint_blocks,
+                                build_for_inference=False, jit_compile=False,
+                                input_shape=backend.int_shape(img_input)[1:])
+            other = InceptionV3(**dict(other_kwargs, **submodules))
+            other.load_weights(weights)
+            inception_layers = model.layers
+            if input_tensor is not None:
+                # leave out layers which produce `input_tensor`
+                source_layers = models.Model(inputs, img_input).layers
+                inception_layers = [l for l in model.layers if l not in source_layers]
+            _copy_weights(other.layers, inception_layers)
+
+    if build_for_inference:
+        model = _fold_batch_norms(model)
+
+    if jit_compile:
+        model.call = tf.function(model.call, jit_compile=True)
 
     return model
 
 
+def _file_stamp(path):
+    """Modification time and size of `path`, used to detect overwritten files."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@functools.lru_cache(maxsize=8)
+def _build_cached(submodules, data_format, dtype_policy, weights_stamp, **model_kwargs):
+    # `data_format`, `dtype_policy` and `weights_stamp` are only part of the cache key
+    backend, layers, models, utils = submodules
+    return InceptionV3(
+        backend=backend, layers=layers, models=models, utils=utils, **model_kwargs)
+
+
+def clear_model_cache():
+    """Drops models cached by `InceptionV3(..., cache=True)`."""
+    _build_cached.cache_clear()
+
+
 def preprocess_input(x, **kwargs):
     """Preprocesses a numpy array encoding a batch of images.
 
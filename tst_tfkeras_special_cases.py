@@ -217,6 +217,290 @@ def tst_keras():
         print(get_model_memory_usage(1, model), 'GB')
         reset_default_graph()
 
+    if 1:
+        import os
+        import tempfile
+        import numpy as np
+        from tensorflow.keras.models import load_model
+
+        type = 'inceptionv3'
+        print('Go for {} with space-to-depth stem'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(
+            input_shape=(32, 32, 32, 3),
+            include_top=False,
+            weights=None,
+            space_to_depth_stem=True,
+        )
+        assert 'space_to_depth' in [l.name for l in model.layers]
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        path = os.path.join(tempfile.mkdtemp(), 'inceptionv3_s2d.h5')
+        model.save(path)
+        loaded = load_model(path, compile=False, safe_mode=False)
+        diff = np.abs(model.predict(x, verbose=0) - loaded.predict(x, verbose=0)).max()
+        print('Max diff after h5 reload: {}'.format(diff))
+        assert diff < 1e-5
+        reset_default_graph()
+
+    if 1:
+        import numpy as np
+
+        def layers_in_creation_order(model, layer_type):
+            # auto-generated names get increasing suffixes: conv3d, conv3d_1, ...
+            def index(layer):
+                suffix = layer.name.rsplit('_', 1)[-1]
+                return int(suffix) if suffix.isdigit() else 0
+            return sorted([l for l in model.layers if l.__class__.__name__ == layer_type], key=index)
+
+        type = 'inceptionv3'
+        print('Go for {} pool/projection order equivalence'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None,
+                           project_before_pool=True)
+        legacy = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None)
+        for layer_type in ('Conv3D', 'BatchNormalization'):
+            for src, dst in zip(layers_in_creation_order(model, layer_type),
+                                layers_in_creation_order(legacy, layer_type)):
+                dst.set_weights(src.get_weights())
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        diff = np.abs(model.predict(x, verbose=0) - legacy.predict(x, verbose=0)).max()
+        print('Max diff: {}'.format(diff))
+        assert diff < 1e-4
+        reset_default_graph()
+
+    if 1:
+        import os
+        import tempfile
+        import numpy as np
+        from tensorflow.keras.layers import Conv3D, Input
+
+        type = 'inceptionv3'
+        print('Go for {} with gradient checkpointing'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=True, weights=None, classes=2)
+        path = os.path.join(tempfile.mkdtemp(), 'inceptionv3.h5')
+        model.save_weights(path)
+        checkpointed = modelPoint(input_shape=(32, 32, 32, 3), include_top=True, weights=path, classes=2,
+                                  checkpoint_blocks=True)
+        x = np.random.uniform(size=(2, 32, 32, 32, 3)).astype(np.float32)
+        diff = np.abs(model.predict(x, verbose=0) - checkpointed.predict(x, verbose=0)).max()
+        print('Max diff: {}'.format(diff))
+        assert diff < 1e-5
+        checkpointed.compile(optimizer='adam', loss='categorical_crossentropy')
+        checkpointed.fit(x, np.eye(2)[[0, 1]], epochs=1, verbose=0)
+        checkpointed.save_weights(path)
+        for checkpoint_blocks in (True, False):
+            reloaded = modelPoint(input_shape=(32, 32, 32, 3), include_top=True, weights=path, classes=2,
+                                  checkpoint_blocks=checkpoint_blocks)
+            diff = np.abs(checkpointed.predict(x, verbose=0) - reloaded.predict(x, verbose=0)).max()
+            print('Max diff after reload (checkpoint_blocks={}): {}'.format(checkpoint_blocks, diff))
+            assert diff < 1e-5
+        folded = modelPoint(input_shape=(32, 32, 32, 3), include_top=True, weights=path, classes=2,
+                            build_for_inference=True)
+        diff = np.abs(checkpointed.predict(x, verbose=0) - folded.predict(x, verbose=0)).max()
+        print('Max diff after reload (build_for_inference=True): {}'.format(diff))
+        assert diff < 1e-4
+        # input tensor with predecessor layers
+        inputs = Input(shape=(32, 32, 32, 3))
+        stem = Conv3D(3, 1, name='user_stem')(inputs)
+        with_stem = modelPoint(input_tensor=stem, include_top=True, weights=path, classes=2)
+        for a, b in zip(checkpointed.get_layer('predictions').get_weights(),
+                        with_stem.get_layer('predictions').get_weights()):
+            assert np.array_equal(a, b)
+        reset_default_graph()
+
+    if 1:
+        from tensorflow.keras import mixed_precision
+
+        type = 'inceptionv3'
+        print('Go for {} with mixed precision'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=True, weights=None, classes=2,
+                           dtype_policy='mixed_float16')
+        conv = [l for l in model.layers if l.__class__.__name__ == 'Conv3D'][0]
+        assert conv.compute_dtype == 'float16'
+        assert model.get_layer('predictions').compute_dtype == 'float32'
+        assert mixed_precision.global_policy().name == 'float32'
+        reset_default_graph()
+
+    if 1:
+        import os
+        import tempfile
+        import time
+
+        type = 'inceptionv3'
+        print('Go for {} with model cache'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        path = os.path.join(tempfile.mkdtemp(), 'inceptionv3.h5')
+        modelPoint(input_shape=(32, 32, 32, 3), weights=None).save_weights(path)
+        model = modelPoint(input_shape=(32, 32, 32, 3), weights=path, cache=True)
+        assert modelPoint(input_shape=(32, 32, 32, 3), weights=path, cache=True) is model
+        modelPoint(input_shape=(32, 32, 32, 3), weights=None).save_weights(path)
+        # filesystems may store modification time with 1-2 s granularity
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+        assert modelPoint(input_shape=(32, 32, 32, 3), weights=path, cache=True) is not model
+        reset_default_graph()
+
+    if 1:
+        import os
+        import tempfile
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with folded batch norms'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None, pooling='avg')
+        for layer in model.layers:
+            if layer.__class__.__name__ == 'BatchNormalization':
+                layer.set_weights([np.random.uniform(0.5, 1.5, size=w.shape) for w in layer.get_weights()])
+        path = os.path.join(tempfile.mkdtemp(), 'inceptionv3.h5')
+        model.save_weights(path)
+        folded = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=path, pooling='avg',
+                            build_for_inference=True)
+        assert 'BatchNormalization' not in [l.__class__.__name__ for l in folded.layers]
+        x = np.random.uniform(size=(2, 32, 32, 32, 3)).astype(np.float32)
+        diff = np.abs(model.predict(x, verbose=0) - folded.predict(x, verbose=0)).max()
+        print('Max diff: {}'.format(diff))
+        assert diff < 1e-4
+        reset_default_graph()
+
+    if 1:
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with factorized 5x5x5 branches'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None)
+        factorized = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None,
+                                factorize_5x5=True)
+        assert factorized.count_params() < model.count_params()
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        assert factorized.predict(x, verbose=0).shape == model.predict(x, verbose=0).shape
+        reset_default_graph()
+
+    if 1:
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with 1x1x7 factor in 7x7 branches'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None)
+        extended = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None,
+                              factorize_7x7x7=True)
+
+        def conv_count(m):
+            return len([l for l in m.layers if l.__class__.__name__ == 'Conv3D'])
+
+        # 3 extra convolutions in each of mixed 4-7 and 1 in mixed 8
+        assert conv_count(extended) == conv_count(model) + 13
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        assert extended.predict(x, verbose=0).shape == model.predict(x, verbose=0).shape
+        reset_default_graph()
+
+    if 1:
+        import os
+        import tempfile
+        import numpy as np
+        import tensorflow as tf
+        from classification_models_3D.models import inception_v3
+
+        type = 'inceptionv3'
+        print('Go for {} with channels_last forced on GPU'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        reference = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None)
+        path = os.path.join(tempfile.mkdtemp(), 'inceptionv3.h5')
+        reference.save_weights(path)
+        # CPU kernels don't support channels_first Conv3D, so compare with
+        # the channels_last model on transposed input and output
+        gpu_available = inception_v3._gpu_available
+        inception_v3._gpu_available = lambda: True
+        tf.keras.backend.set_image_data_format('channels_first')
+        try:
+            forced = modelPoint(input_shape=(3, 32, 32, 32), include_top=False, weights=path)
+        finally:
+            tf.keras.backend.set_image_data_format('channels_last')
+            inception_v3._gpu_available = gpu_available
+        permutes = [l for l in forced.layers if l.__class__.__name__ == 'Permute']
+        assert [l.dims for l in permutes] == [(2, 3, 4, 1), (4, 1, 2, 3)]
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        ref = reference.predict(x, verbose=0).transpose(0, 4, 1, 2, 3)
+        out = forced.predict(x.transpose(0, 4, 1, 2, 3), verbose=0)
+        assert out.shape == ref.shape
+        diff = np.abs(out - ref).max()
+        print('Max diff: {}'.format(diff))
+        assert diff < 1e-5
+        reset_default_graph()
+
+    if 1:
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with channel_multiple'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None, channel_multiple=32)
+        for layer in model.layers:
+            if layer.__class__.__name__ == 'Conv3D':
+                assert layer.filters % 32 == 0, layer.name
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        print(model.predict(x, verbose=0).shape)
+        reset_default_graph()
+
+    if 1:
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with per-axis stride_size'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None,
+                           stride_size=(2, 2, (2, 2, 1), 2, (1, 2, 2)))
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        out = model.predict(x, verbose=0)
+        print(out.shape)
+        assert out.shape[1:4] == (2, 1, 2)
+        reset_default_graph()
+        try:
+            modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None, stride_size=(2, 2, 2, 2))
+        except ValueError as e:
+            print('Expected error: {}'.format(e))
+        else:
+            raise AssertionError('stride_size of length 4 must raise ValueError')
+        reset_default_graph()
+
+    if 1:
+        import os
+        import tempfile
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with XLA jit_compile'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None)
+        path = os.path.join(tempfile.mkdtemp(), 'inceptionv3.h5')
+        model.save_weights(path)
+        compiled = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=path, jit_compile=True)
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        diff = np.abs(model.predict(x, verbose=0) - compiled.predict(x, verbose=0)).max()
+        print('Max diff: {}'.format(diff))
+        assert diff < 1e-4
+        reset_default_graph()
+
+    if 1:
+        import numpy as np
+
+        type = 'inceptionv3'
+        print('Go for {} with shared mixed5/mixed6 weights'.format(type))
+        modelPoint, preprocess_input = Classifiers.get(type)
+        model = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None)
+        shared = modelPoint(input_shape=(32, 32, 32, 3), include_top=False, weights=None, share_weights=True)
+        names = [l.name for l in shared.layers]
+        assert 'mixed5_6' in names and 'mixed5' not in names and 'mixed6' not in names
+        print('Params: {} -> {}'.format(model.count_params(), shared.count_params()))
+        assert shared.count_params() < model.count_params()
+        x = np.random.uniform(size=(1, 32, 32, 32, 3)).astype(np.float32)
+        assert shared.predict(x, verbose=0).shape == model.predict(x, verbose=0).shape
+        reset_default_graph()
+
 
 if __name__ == '__main__':
     tst_keras()